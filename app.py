@@ -2,10 +2,12 @@ import os
 import sys
 import logging
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from logging.handlers import RotatingFileHandler
 from typing import Dict, Any, Tuple
 
-from flask import Flask, request, jsonify
+import orjson
+from flask import Flask, Response, request
 
 # Configure logging before other imports to ensure all loggers are properly configured
 log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -18,9 +20,8 @@ console_handler.setFormatter(log_formatter)
 file_handler = RotatingFileHandler('app.log', maxBytes=1024 * 1024, backupCount=5)
 file_handler.setFormatter(log_formatter)
 
-# Configure root logger
+# Configure root logger (level is set from config below)
 root_logger = logging.getLogger()
-root_logger.setLevel(logging.DEBUG)
 root_logger.addHandler(console_handler)
 root_logger.addHandler(file_handler)
 
@@ -33,6 +34,10 @@ logger = logging.getLogger(__name__)
 
 # Import application components after configuring logging
 from config import config
+
+# Only process debug records in debug mode
+root_logger.setLevel(logging.DEBUG if config.DEBUG else logging.INFO)
+
 from utils.sms_parser import parse_sms
 from utils.maps_client import MapsClient
 from utils.sms_sender import SMSSender
@@ -45,8 +50,15 @@ app.config.from_object(config)
 logger.info("Initializing application components...")
 maps_client = MapsClient()
 sms_sender = SMSSender()
+
+# Processes the messages of a batch webhook concurrently (greenlets under gevent)
+batch_executor = ThreadPoolExecutor(max_workers=config.BATCH_WORKERS)
 logger.info("Application components initialized")
 
+def json_response(payload: Dict[str, Any], status: int = 200) -> Response:
+    """Serialize a payload to a JSON response using orjson."""
+    return Response(orjson.dumps(payload), status=status, mimetype="application/json")
+
 def process_sms(sender: str, message: str) -> Tuple[bool, str]:
     """
     Process incoming SMS and return a response.
@@ -59,58 +71,75 @@ def process_sms(sender: str, message: str) -> Tuple[bool, str]:
         Tuple of (success, response_message)
     """
     try:
-        logger.info(f"Processing SMS from {sender}: {message}")
+        logger.info("Processing SMS from %s: %s", sender, message)
         
         # Parse the SMS to get location and route
         location, route = parse_sms(message)
-        logger.info(f"Parsed - Location: '{location}', Route: '{route}'")
+        logger.info("Parsed - Location: '%s', Route: '%s'", location, route)
         
         if not location or not route:
-            logger.warning(f"Failed to parse message: {message}")
+            logger.warning("Failed to parse message: %s", message)
             return False, config.DEFAULT_RESPONSE
         
-        logger.info(f"Searching for bus stops near: {location}")
+        logger.info("Searching for bus stops near: %s", location)
+        
+        # Geocode the location once; both the stop search and the ETA
+        # lookup reuse the coordinates so Google doesn't geocode it again
+        coordinates = maps_client.get_coordinates(location)
         
         # Find nearby bus stops
-        bus_stops = maps_client.find_nearby_bus_stops(location)
+        bus_stops = maps_client.find_bus_stops_near(*coordinates) if coordinates else None
         
         if not bus_stops:
-            logger.warning(f"No bus stops found near {location}")
+            logger.warning("No bus stops found near %s", location)
             return False, f"No bus stops found near {location}. Please try a different location."
         
-        logger.info(f"Found {len(bus_stops)} bus stops. Closest: {bus_stops[0]['name']}")
+        logger.info("Found %s bus stops. Closest: %s", len(bus_stops), bus_stops[0]['name'])
         
         # For demo, we'll use the closest bus stop
         closest_stop = bus_stops[0]
         
-        # Get ETA from current location to the bus stop
-        logger.info(f"Getting ETA from {location} to bus stop: {closest_stop['name']}")
-        
-        eta_data = maps_client.get_eta(
-            origin=location,
-            destination=closest_stop["location"]
-        )
+        if closest_stop["distance"] < config.SHORT_WALK_DISTANCE:
+            # The stop is right there; estimate the walk instead of asking
+            # the Directions API
+            logger.info("Bus stop %s is %sm away, skipping Directions API",
+                        closest_stop['name'], closest_stop['distance'])
+            walk_minutes = int(closest_stop["distance"] / config.WALKING_SPEED / 60) + 1
+            eta_data = {
+                "duration": f"{walk_minutes} min",
+                "distance": f"{closest_stop['distance']} m"
+            }
+        else:
+            # Get ETA from current location to the bus stop
+            logger.info("Getting ETA from %s to bus stop: %s", location, closest_stop['name'])
+            
+            eta_data = maps_client.get_eta(
+                origin=coordinates,
+                destination=closest_stop["location"]
+            )
         
-        logger.info(f"ETA data received: {eta_data}")
+        logger.debug("ETA data received: %s", eta_data)
         
         if not eta_data:
-            logger.warning(f"Could not get ETA for route {route} near {location}")
+            logger.warning("Could not get ETA for route %s near %s", route, location)
             return False, f"Could not get ETA for route {route} near {location}."
         
         # Format the response
-        response = (
-            f" Bus {route} Info:\n"
-            f" Nearest Stop: {closest_stop['name']} ({closest_stop['distance']}m)\n"
-            f" Walking Time: {eta_data.get('duration', 'Unknown')}\n"
-            f" Distance: {eta_data.get('distance', 'Unknown')}\n"
-            "\n Next bus in ~5 min"  # Placeholder for actual bus schedule data
-        )
-        
-        logger.info(f"Response prepared: {response}")
+        lines = [
+            f" Bus {route} Info:",
+            f" Nearest Stop: {closest_stop['name']} ({closest_stop['distance']}m)",
+            f" Walking Time: {eta_data.get('duration', 'Unknown')}",
+            f" Distance: {eta_data.get('distance', 'Unknown')}",
+            "",
+            " Next bus in ~5 min",  # Placeholder for actual bus schedule data
+        ]
+        response = "\n".join(lines)
+        
+        logger.debug("Response prepared: %s", response)
         return True, response
         
     except Exception as e:
-        logger.exception(f"Error in process_sms: {str(e)}")
+        logger.exception("Error in process_sms: %s", e)
         return False, f"Sorry, an error occurred while processing your request: {str(e)}"
 
 @app.route('/')
@@ -122,7 +151,7 @@ def webhook():
     """Handle incoming SMS webhook from Fast2SMS."""
     try:
         data = request.get_json()
-        logger.info(f"Received webhook data: {data}")
+        logger.debug("Received webhook data: %s", data)
         
         # Extract sender and message from webhook data
         sender = data.get('sender_id', '')
@@ -130,50 +159,48 @@ def webhook():
         
         if not message or not sender:
             logger.error("Missing message or sender in webhook data")
-            return jsonify({"status": "error", "message": "Missing message or sender"}), 400
-        
-        logger.info(f"Processing message from {sender}: {message}")
+            return json_response({"status": "error", "message": "Missing message or sender"}, 400)
         
         # Process the SMS
         success, response = process_sms(sender, message)
         
-        logger.info(f"Processed message. Success: {success}, Response: {response}")
+        logger.debug("Processed message. Success: %s, Response: %s", success, response)
         
         # For testing, just return the response without sending SMS
         # In production, you would uncomment the SMS sending code
         
         if success:
             # Log the SMS being sent
-            logger.info(f"=== Attempting to send SMS ===")
-            logger.info(f"To: {sender}")
-            logger.info(f"Message: {response}")
+            logger.info("=== Attempting to send SMS ===")
+            logger.info("To: %s", sender)
+            logger.debug("Message: %s", response)
             
             try:
                 # Send the actual SMS
                 logger.info("Calling SMS sender...")
                 sms_response = sms_sender.send_sms(sender, response)
-                logger.info(f"SMS send response: {sms_response}")
+                logger.debug("SMS send response: %s", sms_response)
                 
                 # Check if SMS was sent successfully
                 if not sms_response.get('return'):
-                    logger.error(f"❌ Failed to send SMS: {sms_response.get('message')}")
-                    return jsonify({
+                    logger.error("❌ Failed to send SMS: %s", sms_response.get('message'))
+                    return json_response({
                         "status": "error", 
                         "message": "Failed to send SMS",
                         "details": sms_response
-                    }), 500
+                    }, 500)
                 else:
                     logger.info("✅ SMS sent successfully!")
                     
             except Exception as e:
-                logger.error(f"🔥 Exception while sending SMS: {str(e)}", exc_info=True)
-                return jsonify({
+                logger.error("🔥 Exception while sending SMS: %s", e, exc_info=True)
+                return json_response({
                     "status": "error",
                     "message": f"Error sending SMS: {str(e)}"
-                }), 500
+                }, 500)
         
         
-        return jsonify({
+        return json_response({
             "status": "success",
             "message": response if success else "Failed to process request",
             "processed_data": {
@@ -185,11 +212,102 @@ def webhook():
         
     except Exception as e:
         logger.exception("Error processing webhook")
-        return jsonify({
+        return json_response({
             "status": "error", 
             "message": str(e),
             "traceback": traceback.format_exc()
-        }), 500
+        }, 500)
+
+@app.route('/webhook/batch', methods=['POST'])
+def webhook_batch():
+    """Handle a batch of incoming SMS, replying with one bulk Fast2SMS request per distinct response."""
+    try:
+        data = request.get_json()
+        logger.debug("Received batch webhook data: %s", data)
+        
+        if not isinstance(data, list):
+            logger.error("Batch webhook data is not a list")
+            return json_response({"status": "error", "message": "Expected a JSON array of messages"}, 400)
+        
+        # Every entry can cost several Maps API calls, so cap the batch size
+        if len(data) > config.MAX_BATCH_SIZE:
+            logger.error("Batch of %s messages exceeds the limit of %s", len(data), config.MAX_BATCH_SIZE)
+            return json_response({
+                "status": "error",
+                "message": f"Too many messages in batch (max {config.MAX_BATCH_SIZE})"
+            }, 413)
+        
+        entries = []
+        for item in data:
+            sender = item.get('sender_id') if isinstance(item, dict) else None
+            message = item.get('message') if isinstance(item, dict) else None
+            
+            # Phone numbers may arrive as JSON numbers; anything else that
+            # isn't a string is treated as missing
+            if isinstance(sender, int) and not isinstance(sender, bool):
+                sender = str(sender)
+            sender = sender.strip() if isinstance(sender, str) else ''
+            message = message.strip() if isinstance(message, str) else ''
+            entries.append((sender, message))
+        
+        def process_entry(entry: Tuple[str, str]) -> Tuple[bool, str]:
+            sender, message = entry
+            if not message or not sender:
+                logger.warning("Skipping batch entry with missing or invalid message or sender: %r", entry)
+                return False, "Missing or invalid message or sender"
+            return process_sms(sender, message)
+        
+        # The Maps lookups for different messages are independent, so run
+        # them concurrently instead of one SMS after another
+        results = []
+        outgoing = []
+        for (sender, message), (success, response) in zip(entries, batch_executor.map(process_entry, entries)):
+            result = {"original_message": message, "sender": sender, "success": success,
+                      "response": response, "sms_sent": False}
+            results.append(result)
+            if success:
+                outgoing.append((sender, response, result))
+        
+        if outgoing:
+            sms_responses = sms_sender.send_bulk([(sender, response) for sender, response, _ in outgoing])
+            logger.debug("SMS bulk send responses: %s", sms_responses)
+            for (_, _, result), sms_response in zip(outgoing, sms_responses):
+                result["sms_sent"] = bool(sms_response.get('return'))
+                if not result["sms_sent"]:
+                    result["sms_error"] = sms_response.get('message')
+        
+        sent = sum(1 for _, _, result in outgoing if result["sms_sent"])
+        
+        # Report partial delivery as 207 rather than 5xx, so a retrying webhook
+        # sender doesn't resend SMS to recipients who already got theirs
+        if outgoing and sent == 0:
+            logger.error("❌ Failed to send any batched SMS")
+            return json_response({
+                "status": "error",
+                "message": "Failed to send SMS",
+                "processed_data": results
+            }, 500)
+        
+        if sent < len(outgoing):
+            logger.error("❌ Failed to send %s of %s batched SMS", len(outgoing) - sent, len(outgoing))
+            return json_response({
+                "status": "partial",
+                "message": "Failed to send some SMS",
+                "processed_data": results
+            }, 207)
+        
+        return json_response({
+            "status": "success",
+            "processed_data": results
+        })
+        
+    except Exception as e:
+        logger.exception("Error processing batch webhook")
+        return json_response({
+            "status": "error",
+            "message": str(e),
+            "traceback": traceback.format_exc()
+        }, 500)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5002))  # Changed to 5002 to avoid conflicts
@@ -19,6 +19,22 @@ class Config:
     # Application Settings
     MAX_SMS_LENGTH = 160
     DEFAULT_RESPONSE = "Sorry, we couldn't process your request. Please try again with format: LOCATION ROUTE_NUMBER"
+    SHORT_WALK_DISTANCE = 50  # meters; closer stops skip the Directions API
+    WALKING_SPEED = 1.4  # meters per second
+    
+    # Outgoing HTTP connections kept per API host (per worker); match the
+    # number of requests a worker handles concurrently
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '100'))
+    
+    # Cache Settings (geocoding, bus stop and ETA lookups)
+    GEOCODE_CACHE_SIZE = 4096
+    GEOCODE_CACHE_TTL = 24 * 60 * 60  # 1 day, in seconds
+    ETA_CACHE_SIZE = 2048
+    ETA_CACHE_TTL = 60  # seconds; transit ETAs are stable at minute granularity
+    
+    # Batch Webhook
+    MAX_BATCH_SIZE = 100  # messages accepted per /webhook/batch request
+    BATCH_WORKERS = 8  # messages of a /webhook/batch request processed concurrently
 
 # Create configuration instance
 config = Config()
@@ -0,0 +1,48 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+def create_session(pool_connections: int = 4, pool_maxsize: int = 16,
+                   retry: bool = True) -> requests.Session:
+    """
+    Create a requests session with keep-alive connection pooling.
+    
+    Reusing one session per API client lets back-to-back calls to the same
+    host share a TCP/TLS connection instead of handshaking every time. The
+    pool blocks when all pool_maxsize connections are busy, so requests wait
+    for a pooled connection instead of opening throwaway ones.
+    
+    Args:
+        pool_connections: Number of per-host connection pools to cache
+        pool_maxsize: Maximum number of connections per host; size it to the
+            expected number of concurrent requests
+        retry: Retry once on connection errors and 429/5xx responses. Read
+            timeouts are never retried, so a slow API fails after one timeout.
+            Disable for callers that run their own retry loop.
+        
+    Returns:
+        Configured requests.Session
+    """
+    if retry:
+        retries = Retry(
+            total=1,
+            connect=1,
+            read=0,
+            status=1,
+            backoff_factor=0.2,
+            status_forcelist=[429, 500, 502, 503, 504],
+            respect_retry_after_header=False
+        )
+    else:
+        retries = Retry(total=0, read=False)
+    
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=retries,
+        pool_block=True
+    )
+    
+    session = requests.Session()
+    session.mount("https://", adapter)
+    return session
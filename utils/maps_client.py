@@ -1,13 +1,42 @@
 import logging
+import threading
 import requests
-from typing import Dict, Optional, Tuple
-from geopy.distance import geodesic
+from typing import Dict, Optional, Tuple, Union
+import numpy as np
+import orjson
+from cachetools import TTLCache
 
 from config import config
+from utils.http_session import create_session
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
+# Mean Earth radius in meters, used for haversine distances
+EARTH_RADIUS_M = 6371000
+
+# A place given either as an address or as (lat, lng) coordinates
+Location = Union[str, Tuple[float, float]]
+
+def _format_location(location: Location) -> str:
+    """Format a location for a Maps API query parameter."""
+    if isinstance(location, tuple):
+        return f"{location[0]},{location[1]}"
+    return location
+
+def _location_cache_key(location: Location) -> Union[str, Tuple[float, float]]:
+    """Cache key for a location: coordinates rounded to ~11 m, or a normalized address."""
+    if isinstance(location, tuple):
+        return (round(location[0], 4), round(location[1], 4))
+    return " ".join(location.lower().split())
+
+def _haversine_meters(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """Great-circle distances in meters from one point to arrays of points."""
+    dlat = np.radians(lats - lat)
+    dlng = np.radians(lngs - lng)
+    a = np.sin(dlat / 2) ** 2 + np.cos(np.radians(lat)) * np.cos(np.radians(lats)) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
 class MapsClient:
     """Client for interacting with Google Maps API."""
     
@@ -15,9 +44,23 @@ class MapsClient:
     
     def __init__(self, api_key: str = None):
         self.api_key = api_key or config.GOOGLE_MAPS_API_KEY
+        self._session = create_session(pool_maxsize=config.HTTP_POOL_MAXSIZE)
+        
+        # Short-term caches for repeated lookups of the same place
+        self._cache_lock = threading.Lock()
+        self._geocode_cache = TTLCache(maxsize=config.GEOCODE_CACHE_SIZE, ttl=config.GEOCODE_CACHE_TTL)
+        self._stops_cache = TTLCache(maxsize=config.GEOCODE_CACHE_SIZE, ttl=config.GEOCODE_CACHE_TTL)
+        self._eta_cache = TTLCache(maxsize=config.ETA_CACHE_SIZE, ttl=config.ETA_CACHE_TTL)
     
     def geocode(self, address: str) -> Optional[Dict]:
         """Convert address to coordinates."""
+        cache_key = " ".join(address.lower().split())
+        with self._cache_lock:
+            cached = self._geocode_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Geocode cache hit for: %s", cache_key)
+            return cached
+        
         endpoint = f"{self.BASE_URL}/geocode/json"
         params = {
             "address": address,
@@ -25,37 +68,49 @@ class MapsClient:
         }
         
         try:
-            response = requests.get(endpoint, params=params)
+            response = self._session.get(endpoint, params=params, timeout=10)
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content)
             
             if data.get("status") == "OK" and data.get("results"):
-                return data["results"][0]
+                result = data["results"][0]
+                with self._cache_lock:
+                    self._geocode_cache[cache_key] = result
+                return result
             return None
             
         except (requests.RequestException, ValueError) as e:
-            print(f"Geocoding error: {e}")
+            logger.error("Geocoding error: %s", e)
             return None
     
-    def get_eta(self, origin: str, destination: str, mode: str = "transit") -> Optional[Dict]:
+    def get_eta(self, origin: Location, destination: Location, mode: str = "transit",
+                include_steps: bool = False) -> Optional[Dict]:
         """
         Get estimated time of arrival between two points using Google Directions API.
         
         Args:
-            origin: Starting point as address or lat,lng
-            destination: Destination point as address or lat,lng
+            origin: Starting point as address or (lat, lng) tuple
+            destination: Destination point as address or (lat, lng) tuple
             mode: Travel mode (driving, walking, bicycling, transit)
+            include_steps: Also return turn-by-turn steps as
+                (instruction, distance, duration, travel_mode) tuples (None otherwise)
             
         Returns:
             Dictionary with ETA and distance information or None if failed
         """
-        logger = logging.getLogger(__name__)
-        logger.info(f"Getting ETA from {origin} to {destination} (mode: {mode})")
+        logger.debug("Getting ETA from %s to %s (mode: %s)", origin, destination, mode)
+        
+        cache_key = (_location_cache_key(origin), _location_cache_key(destination), mode, include_steps)
+        with self._cache_lock:
+            cached = self._eta_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("ETA cache hit for: %s", cache_key)
+            return cached
         
         endpoint = f"{self.BASE_URL}/directions/json"
         params = {
-            "origin": origin,
-            "destination": destination,
+            "origin": _format_location(origin),
+            "destination": _format_location(destination),
             "mode": mode,
             "key": self.api_key,
             "transit_mode": "bus",
@@ -64,16 +119,16 @@ class MapsClient:
         }
         
         try:
-            logger.debug(f"Making Directions API request with params: {params}")
-            response = requests.get(endpoint, params=params, timeout=10)
+            logger.debug("Making Directions API request with params: %s", params)
+            response = self._session.get(endpoint, params=params, timeout=10)
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content)
             
-            logger.debug(f"Directions API response status: {data.get('status')}")
+            logger.debug("Directions API response status: %s", data.get('status'))
             
             if data.get("status") != "OK":
                 error_msg = data.get("error_message", "No error message")
-                logger.error(f"Directions API error: {data.get('status')} - {error_msg}")
+                logger.error("Directions API error: %s - %s", data.get('status'), error_msg)
                 return None
                 
             if not data.get("routes"):
@@ -90,18 +145,20 @@ class MapsClient:
             leg = legs[0]
             
             # Get duration and distance
-            duration = leg.get("duration", {}).get("text", "Unknown")
-            distance = leg.get("distance", {}).get("text", "Unknown")
-            
-            # Get steps for more detailed information
-            steps = []
-            for step in leg.get("steps", []):
-                steps.append({
-                    "instruction": step.get("html_instructions", ""),
-                    "distance": step.get("distance", {}).get("text", ""),
-                    "duration": step.get("duration", {}).get("text", ""),
-                    "travel_mode": step.get("travel_mode", "")
-                })
+            duration = (leg.get("duration") or {}).get("text", "Unknown")
+            distance = (leg.get("distance") or {}).get("text", "Unknown")
+            
+            # Get steps for more detailed information, only if asked for
+            steps = None
+            if include_steps:
+                steps = []
+                for step in leg.get("steps", ()):
+                    steps.append((
+                        step.get("html_instructions", ""),
+                        (step.get("distance") or {}).get("text", ""),
+                        (step.get("duration") or {}).get("text", ""),
+                        step.get("travel_mode", "")
+                    ))
             
             result = {
                 "duration": duration,
@@ -111,7 +168,9 @@ class MapsClient:
                 "steps": steps
             }
             
-            logger.info(f"Successfully got ETA: {duration} ({distance})")
+            logger.info("Successfully got ETA: %s (%s)", duration, distance)
+            with self._cache_lock:
+                self._eta_cache[cache_key] = result
             return result
             
         except requests.Timeout:
@@ -119,16 +178,41 @@ class MapsClient:
             return None
             
         except requests.RequestException as e:
-            logger.error(f"Request to Directions API failed: {str(e)}")
+            logger.error("Request to Directions API failed: %s", e)
             return None
             
         except (KeyError, IndexError) as e:
-            logger.error(f"Error parsing Directions API response: {str(e)}")
+            logger.error("Error parsing Directions API response: %s", e)
             return None
             
         except Exception as e:
-            logger.exception(f"Unexpected error in get_eta: {str(e)}")
+            logger.exception("Unexpected error in get_eta: %s", e)
+            return None
+    
+    def get_coordinates(self, address: str) -> Optional[Tuple[float, float]]:
+        """
+        Geocode an address to a (lat, lng) pair.
+        
+        Args:
+            address: Address or place name to geocode
+            
+        Returns:
+            Tuple of (latitude, longitude) or None if geocoding failed
+        """
+        geocode_result = self.geocode(address)
+        if not geocode_result:
+            logger.error("Could not geocode location: %s", address)
+            return None
+        
+        try:
+            location = geocode_result["geometry"]["location"]
+            coordinates = (location["lat"], location["lng"])
+        except KeyError as e:
+            logger.error("Error parsing Geocoding API response: %s", e)
             return None
+        
+        logger.info("Location coordinates: %s, %s", coordinates[0], coordinates[1])
+        return coordinates
     
     def find_nearby_bus_stops(self, location: str, radius: int = 1000) -> Optional[list]:
         """
@@ -141,76 +225,102 @@ class MapsClient:
         Returns:
             List of bus stops with details, sorted by distance
         """
-        try:
-            logger = logging.getLogger(__name__)
-            logger.info(f"Searching for bus stops near: {location}")
+        logger.info("Searching for bus stops near: %s", location)
+        
+        # First, get coordinates for the location
+        coordinates = self.get_coordinates(location)
+        if not coordinates:
+            return None
+        
+        return self.find_bus_stops_near(coordinates[0], coordinates[1], radius)
+    
+    def find_bus_stops_near(self, location_lat: float, location_lng: float,
+                            radius: int = 1000) -> Optional[list]:
+        """
+        Find bus stops around already geocoded coordinates using Google Places API.
+        
+        Args:
+            location_lat: Latitude to search near
+            location_lng: Longitude to search near
+            radius: Search radius in meters (max 50000)
             
-            # First, get coordinates for the location
-            geocode_result = self.geocode(location)
-            if not geocode_result:
-                logger.error(f"Could not geocode location: {location}")
-                return None
+        Returns:
+            List of bus stops with details, sorted by distance
+        """
+        # Cache the Places results, not the stops: distances are recomputed
+        # from the exact origin on every call
+        cache_key = (round(location_lat, 4), round(location_lng, 4), radius)
+        with self._cache_lock:
+            cached = self._stops_cache.get(cache_key)
+        
+        try:
+            if cached is not None:
+                logger.debug("Bus stop cache hit for: %s", cache_key)
+                places, locations, coords = cached
+            else:
+                endpoint = f"{self.BASE_URL}/place/nearbysearch/json"
+                params = {
+                    "location": _format_location((location_lat, location_lng)),
+                    "radius": min(radius, 50000),  # Max 50km
+                    "type": "bus_station",
+                    "key": self.api_key
+                }
                 
-            location_lat = geocode_result["geometry"]["location"]["lat"]
-            location_lng = geocode_result["geometry"]["location"]["lng"]
-            logger.info(f"Location coordinates: {location_lat}, {location_lng}")
-            
-            endpoint = f"{self.BASE_URL}/place/nearbysearch/json"
-            params = {
-                "location": f"{location_lat},{location_lng}",
-                "radius": min(radius, 50000),  # Max 50km
-                "type": "bus_station",
-                "key": self.api_key
-            }
-            
-            logger.debug(f"Making Places API request with params: {params}")
-            response = requests.get(endpoint, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            logger.debug(f"Places API response: {data}")
+                logger.debug("Making Places API request with params: %s", params)
+                response = self._session.get(endpoint, params=params, timeout=10)
+                response.raise_for_status()
+                data = orjson.loads(response.content)
+                
+                logger.debug("Places API response: %s", data)
+                
+                if data.get("status") != "OK":
+                    logger.error("Places API error: %s - %s", data.get('status'), data.get('error_message', 'No error message'))
+                    return None
+                
+                places = []
+                locations = []
+                for place in data.get("results", []):
+                    try:
+                        place_location = place["geometry"]["location"]
+                        locations.append((place_location["lat"], place_location["lng"]))
+                        places.append(place)
+                        
+                    except KeyError as e:
+                        logger.warning("Error processing place data: %s", e)
+                        continue
+                
+                if not places:
+                    logger.warning("No bus stops found in the response")
+                    return None
+                
+                coords = np.array(locations, dtype=float)
+                with self._cache_lock:
+                    self._stops_cache[cache_key] = (places, locations, coords)
             
-            if data.get("status") != "OK":
-                logger.error(f"Places API error: {data.get('status')} - {data.get('error_message', 'No error message')}")
-                return None
+            # Calculate distances from original location in meters, all at once
+            distances = _haversine_meters(location_lat, location_lng, coords[:, 0], coords[:, 1])
             
-            stops = []
-            for place in data.get("results", []):
-                try:
-                    stop_lat = place["geometry"]["location"]["lat"]
-                    stop_lng = place["geometry"]["location"]["lng"]
-                    
-                    # Calculate distance from original location in meters
-                    distance = geodesic(
-                        (location_lat, location_lng),
-                        (stop_lat, stop_lng)
-                    ).meters
-                    
-                    stop_info = {
-                        "name": place.get("name", "Bus Stop"),
-                        "address": place.get("vicinity", ""),
-                        "distance": round(distance),
-                        "location": f"{stop_lat},{stop_lng}",
-                        "place_id": place.get("place_id", "")
-                    }
-                    
-                    # Add rating if available
-                    if "rating" in place:
-                        stop_info["rating"] = place["rating"]
-                    
-                    stops.append(stop_info)
-                    
-                except KeyError as e:
-                    logger.warning(f"Error processing place data: {e}")
-                    continue
-            
-            if not stops:
-                logger.warning("No bus stops found in the response")
-                return None
+            # Build stops in order of distance
+            sorted_stops = []
+            for i in np.argsort(distances, kind="stable"):
+                place = places[i]
+                stop_lat, stop_lng = locations[i]
                 
-            # Sort by distance and return
-            sorted_stops = sorted(stops, key=lambda x: x["distance"])
-            logger.info(f"Found {len(sorted_stops)} bus stops")
+                stop_info = {
+                    "name": place.get("name", "Bus Stop"),
+                    "address": place.get("vicinity", ""),
+                    "distance": round(float(distances[i])),
+                    "location": (stop_lat, stop_lng),
+                    "place_id": place.get("place_id", "")
+                }
+                
+                # Add rating if available
+                if "rating" in place:
+                    stop_info["rating"] = place["rating"]
+                
+                sorted_stops.append(stop_info)
+            
+            logger.debug("Found %s bus stops", len(sorted_stops))
             return sorted_stops
             
         except requests.Timeout:
@@ -218,9 +328,9 @@ class MapsClient:
             return None
             
         except requests.RequestException as e:
-            logger.error(f"Request to Places API failed: {str(e)}")
+            logger.error("Request to Places API failed: %s", e)
             return None
             
         except Exception as e:
-            logger.exception(f"Unexpected error in find_nearby_bus_stops: {str(e)}")
+            logger.exception("Unexpected error in find_nearby_bus_stops: %s", e)
             return None
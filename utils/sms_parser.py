@@ -1,10 +1,29 @@
-import re
 import logging
 from typing import Tuple, Optional
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
+def _is_route_number(token: str) -> bool:
+    """
+    Check whether a token is a route number: digits, optionally followed by
+    one letter and more digits (e.g. "12", "12A" or "12A3").
+    """
+    i = 0
+    n = len(token)
+    
+    while i < n and token[i].isdecimal():
+        i += 1
+    if i == 0:
+        return False
+    
+    if i < n and token[i].isascii() and token[i].isalpha():
+        i += 1
+        while i < n and token[i].isdecimal():
+            i += 1
+    
+    return i == n
+
 def parse_sms(message: str) -> Tuple[Optional[str], Optional[str]]:
     """
     Parse SMS message to extract location and route number.
@@ -18,21 +37,21 @@ def parse_sms(message: str) -> Tuple[Optional[str], Optional[str]]:
     if not message or not isinstance(message, str):
         return None, None
     
-    # Clean and normalize the message
-    message = ' '.join(message.strip().split())
-    
-    # Try to extract route number (can be alphanumeric, e.g., "12A" or "123")
-    # Look for numbers or alphanumeric at the end of the message
-    route_match = re.search(r'\b(\d+[A-Za-z]?|\d+[A-Za-z]\d*)\s*$', message)
-    if not route_match:
+    # Split off the last word; the part before it is the location
+    parts = message.rsplit(None, 1)
+    if len(parts) != 2:
         return None, None
     
-    route_number = route_match.group(1).upper()
+    location, route_number = parts
+    
+    # The route number can be alphanumeric, e.g., "12A" or "123"
+    if not _is_route_number(route_number):
+        return None, None
     
-    # The part before the route number is the location
-    location = message[:route_match.start()].strip()
+    # Clean and normalize the location
+    location = ' '.join(location.split())
     
     if not location:
         return None, None
     
-    return location, route_number
+    return location, route_number.upper()
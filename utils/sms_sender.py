@@ -1,21 +1,38 @@
 import logging
+import orjson
+import re
 import requests
+import threading
 import time
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 
 from config import config
+from utils.http_session import create_session
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
+# Indian mobile number, optionally prefixed with 91 or +91 (ASCII digits only)
+_PHONE_RE = re.compile(r'(?:\+?91)?([0-9]{10})')
+
+# Separators allowed inside a phone number, e.g. "+91 98765-43210"
+_PHONE_SEPARATORS_RE = re.compile(r'[\s-]')
+
 class SMSSender:
-    """Handles sending SMS messages via Fast2SMS API."""
+    """
+    Handles sending SMS messages via Fast2SMS API.
+    
+    The API key is not checked against Fast2SMS at startup; an invalid key
+    is reported by send_sms() on the first send.
+    """
     
     def __init__(self, api_key: str = None, sender_id: str = "FSTSMS"):  # Using default FSTSMS sender ID
         self.api_key = api_key or config.FAST2SMS_API_KEY
         self.sender_id = sender_id
         # Updated to use the latest API endpoint
         self.base_url = "https://www.fast2sms.com/dev/bulkV2"
+        # No adapter retries: _post() retries sends itself
+        self._session = create_session(pool_maxsize=config.HTTP_POOL_MAXSIZE, retry=False)
         
         # Validate API key
         if not self.api_key or not isinstance(self.api_key, str) or len(self.api_key) < 20:
@@ -24,16 +41,20 @@ class SMSSender:
         
         # Log the first few characters of the API key for verification (don't log the full key)
         key_preview = f"{self.api_key[:5]}...{self.api_key[-3:]}" if self.api_key else "None"
-        logger.info(f"Initialized SMS Sender with Sender ID: {self.sender_id}, API Key: {key_preview}")
+        logger.info("Initialized SMS Sender with Sender ID: %s, API Key: %s", self.sender_id, key_preview)
         
         self.headers = {
             'authorization': self.api_key,
             'Content-Type': 'application/json',
             'Cache-Control': 'no-cache',
         }
+        # Headers safe to log (API key masked)
+        self._redacted_headers = {k: ('*****' if k.lower() == 'authorization' else v) for k, v in self.headers.items()}
         
-        # Test the API key is valid by making a simple request
-        self._test_api_key()
+        # In debug mode, test the API key in the background so startup doesn't
+        # block on a Fast2SMS round trip
+        if config.DEBUG:
+            threading.Thread(target=self._test_api_key, daemon=True).start()
     
     def _test_api_key(self):
         """Test if the API key is valid by making a test request."""
@@ -47,24 +68,24 @@ class SMSSender:
                 'flash': 0
             }
             
-            response = requests.post(
+            response = self._session.post(
                 self.base_url,
                 headers=self.headers,
                 json=test_payload,
                 timeout=5
             )
             
-            result = response.json()
-            logger.debug(f"API key test response: {result}")
+            result = orjson.loads(response.content)
+            logger.debug("API key test response: %s", result)
             
             if not result.get('return'):
-                logger.error(f"API key test failed: {result.get('message', 'Unknown error')}")
+                logger.error("API key test failed: %s", result.get('message', 'Unknown error'))
                 return False
                 
             return True
             
         except Exception as e:
-            logger.error(f"Error testing API key: {str(e)}")
+            logger.error("Error testing API key: %s", e)
             return False
 
     def send_sms(self, phone_number: str, message: str) -> Dict:
@@ -84,11 +105,67 @@ class SMSSender:
         if not phone_number or not message:
             return {"return": False, "message": "Phone number and message are required"}
             
-        # Ensure phone number is in correct format
-        phone_number = str(phone_number).strip()
-        if not phone_number.startswith('91') and len(phone_number) == 10:
-            phone_number = '91' + phone_number
+        phone_number = self._normalize_phone(phone_number)
+        if not phone_number:
+            return {"return": False, "message": "Invalid phone number"}
+        
+        message = self._prepare_message(message)
+        
+        payload = self._build_payload(phone_number, message)
+        return self._post(payload)
+    
+    def send_bulk(self, entries: List[Tuple[str, str]]) -> List[Dict]:
+        """
+        Send several SMS messages, one API request per distinct message body.
+        
+        Fast2SMS accepts a comma-separated list of numbers, so recipients that
+        get the same message share a single request.
+        
+        Args:
+            entries: List of (phone_number, message) tuples
             
+        Returns:
+            List of API responses, one per entry and in the same order; entries
+            sent in the same request share that request's response
+        """
+        if not self.api_key:
+            return [{"return": False, "message": "API key not configured"} for _ in entries]
+        
+        results: List[Optional[Dict]] = [None] * len(entries)
+        
+        # Group entries by message body, keeping first-seen order
+        groups: Dict[str, List[Tuple[int, str]]] = {}
+        for i, (phone_number, message) in enumerate(entries):
+            if not phone_number or not message:
+                logger.warning("Skipping bulk SMS entry without phone number or message: %r", phone_number)
+                results[i] = {"return": False, "message": "Phone number and message are required"}
+                continue
+            normalized = self._normalize_phone(phone_number)
+            if not normalized:
+                logger.warning("Skipping bulk SMS entry with invalid phone number: %r", phone_number)
+                results[i] = {"return": False, "message": "Invalid phone number"}
+                continue
+            message = self._prepare_message(message)
+            groups.setdefault(message, []).append((i, normalized))
+        
+        for message, members in groups.items():
+            logger.info("Sending bulk SMS to %s recipient(s)", len(members))
+            payload = self._build_payload(",".join(number for _, number in members), message)
+            response = self._post(payload)
+            for i, _ in members:
+                results[i] = response
+        
+        return results
+    
+    def _normalize_phone(self, phone_number: str) -> Optional[str]:
+        """Normalize a phone number to 91XXXXXXXXXX, or None if it isn't valid."""
+        match = _PHONE_RE.fullmatch(_PHONE_SEPARATORS_RE.sub('', str(phone_number)))
+        if not match:
+            return None
+        return '91' + match.group(1)
+    
+    def _prepare_message(self, message: str) -> str:
+        """Trim a message to the SMS length limit."""
         # Split long messages into multiple parts if needed
         max_length = 160
         if len(message) > max_length:
@@ -102,39 +179,42 @@ class SMSSender:
                 message = message[:max_length]
         
         # Clean and format the message
-        message = message.strip()
-        
+        return message.strip()
+    
+    def _build_payload(self, numbers: str, message: str) -> Dict:
+        """Build the Fast2SMS request payload for one or more comma-separated numbers."""
         # Prepare a simple test message
         test_message = f"Test: {message[:20]}"  # Keep it short and simple
         
         # Prepare the request data with minimal parameters
-        payload = {
+        return {
             'route': 'q',  # 'q' for promotional route
             'sender_id': 'FSTSMS',  # Using default sender ID
             'message': test_message,
             'language': 'english',
-            'numbers': str(phone_number).strip(),
+            'numbers': numbers,
             'flash': 0  # 0 for normal SMS
         }
+    
+    def _post(self, payload: Dict) -> Dict:
+        """
+        Post a payload to Fast2SMS, retrying transient failures.
         
+        Args:
+            payload: Request payload from _build_payload()
+            
+        Returns:
+            Dictionary containing API response
+        """
         # For promotional SMS, we don't need DLT registration
         # but we need to follow these guidelines:
         # 1. Message should clearly identify your business
         # 2. Include an opt-out instruction
         # 3. Send during business hours (9 AM to 9 PM)
         
-        logger.debug(f"SMS Payload: {payload}")
-        
         try:
             # Log the request details for debugging
-            logger.debug(f"Sending request to: {self.base_url}")
-            logger.debug(f"Headers: { {k: '*****' if k.lower() == 'authorization' else v for k, v in self.headers.items()} }")
-            logger.debug(f"Payload: {payload}")
-            
-            # Log the request details for debugging
-            logger.debug(f"Sending request to: {self.base_url}")
-            logger.debug(f"Headers: { {k: '*****' if k.lower() == 'authorization' else v for k, v in self.headers.items()} }")
-            logger.debug(f"Payload: {payload}")
+            logger.debug("POST %s headers=%s payload=%s", self.base_url, self._redacted_headers, payload)
             
             # Make the API request with retry logic
             max_retries = 2
@@ -142,20 +222,20 @@ class SMSSender:
             
             for attempt in range(max_retries):
                 try:
-                    response = requests.post(
+                    response = self._session.post(
                         self.base_url,
                         headers=self.headers,
                         json=payload,
                         timeout=10
                     )
-                    result = response.json()
-                    logger.debug(f"Full API response: {result}")
+                    result = orjson.loads(response.content)
+                    logger.debug("Full API response: %s", result)
                     
                     # Check for specific Fast2SMS error codes
                     if not result.get('return'):
                         error_msg = result.get('message', str(result))
-                        logger.error(f"Fast2SMS API error (attempt {attempt + 1}): {error_msg}")
-                        logger.error(f"Full error response: {result}")
+                        logger.error("Fast2SMS API error (attempt %s): %s", attempt + 1, error_msg)
+                        logger.error("Full error response: %s", result)
                         last_error = error_msg
                         
                         # If we get an authentication error, no point in retrying
@@ -172,9 +252,9 @@ class SMSSender:
                     
                     return result
                     
-                except requests.exceptions.RequestException as e:
+                except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
                     last_error = str(e)
-                    logger.error(f"Request failed (attempt {attempt + 1}): {last_error}")
+                    logger.error("Request failed (attempt %s): %s", attempt + 1, last_error)
                     if attempt == max_retries - 1:  # Last attempt
                         break
                     time.sleep(1)  # Wait before retry
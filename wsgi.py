@@ -4,6 +4,11 @@ WSGI config for Bus ETA SMS Service.
 This module contains the WSGI application used by the production server.
 """
 
+# Patch the standard library before anything else is imported, so sockets
+# used by requests become cooperative under gevent
+from gevent import monkey
+monkey.patch_all()
+
 import os
 from app import app
 